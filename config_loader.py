@@ -1,13 +1,25 @@
 """Configuration file loader and validator."""
 
+import functools
 import json
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional, Tuple
 
 
 class Config:
     """Configuration class with defaults and validation."""
     
+    __slots__ = (
+        'threads', 'min_improvement_pct', 'min_file_size', 'hang_timeout', 'recursive',
+        'skip_extensions',
+        'jpegxl_quality', 'jpegxl_effort', 'webp_method', 'conversion_timeout',
+        'timeout_per_mb', 'timeout_min_seconds', 'max_animated_frames',
+        'streaming_threshold_mp', 'streaming_effort', 'also_try_webp_for_jpeg', 'early_exit_ratio',
+        'adaptive_effort', 'adaptive_effort_steps',
+        'deduplicate', 'max_megapixels_in_flight', 'temp_dir',
+        'log_file', 'log_verbosity', 'enable_notifications',
+    )
+    
     def __init__(self, config_dict: Optional[Dict[str, Any]] = None):
         """Initialize config with defaults or provided values."""
         if config_dict is None:
@@ -16,26 +28,49 @@ class Config:
         # Processing settings
         self.threads: int = config_dict.get('threads', 1)
         self.min_improvement_pct: float = config_dict.get('min_improvement_pct', 5.0)
+        self.min_file_size: int = config_dict.get('min_file_size', 4096)  # bytes
         self.hang_timeout: int = config_dict.get('hang_timeout', 300)  # seconds
         self.recursive: bool = config_dict.get('recursive', True)
+        self.deduplicate: bool = config_dict.get('deduplicate', False)
+        self.max_megapixels_in_flight: float = config_dict.get('max_megapixels_in_flight', 0)  # 0 = no limit
+        # '' (or null) = next to each image, 'auto' = /dev/shm when it has room
+        self.temp_dir: str = config_dict.get('temp_dir') or ''
         
-        # File filtering
-        self.skip_extensions: List[str] = config_dict.get('skip_extensions', ['.webp', '.jxl'])
+        # File filtering (normalized to lowercase with leading dots)
+        self.skip_extensions: Tuple[str, ...] = tuple(
+            '.' + ext.lower().lstrip('.')
+            for ext in config_dict.get('skip_extensions', ('.webp', '.jxl', '.avif'))
+        )
         
         # Conversion settings
         self.jpegxl_quality: int = config_dict.get('jpegxl_quality', 100)
         self.jpegxl_effort: int = config_dict.get('jpegxl_effort', 9)
         self.webp_method: int = config_dict.get('webp_method', 6)
         self.conversion_timeout: int = config_dict.get('conversion_timeout', 300)  # seconds
+        self.timeout_per_mb: float = config_dict.get('timeout_per_mb', 10.0)  # seconds per MB
+        self.timeout_min_seconds: int = config_dict.get('timeout_min_seconds', 30)
         self.max_animated_frames: int = config_dict.get('max_animated_frames', 1000)
+        self.streaming_threshold_mp: float = config_dict.get('streaming_threshold_mp', 30.0)  # megapixels
+        self.streaming_effort: int = config_dict.get('streaming_effort', 8)
+        self.also_try_webp_for_jpeg: bool = config_dict.get('also_try_webp_for_jpeg', False)
+        self.early_exit_ratio: float = config_dict.get('early_exit_ratio', 0)  # 0 = always run both encoders
+        # (min_megapixels, effort) steps, sorted by size; only used when adaptive_effort is on
+        self.adaptive_effort: bool = config_dict.get('adaptive_effort', False)
+        self.adaptive_effort_steps: Tuple[Tuple[float, int], ...] = tuple(sorted(
+            (float(min_mp), int(step_effort))
+            for min_mp, step_effort in config_dict.get(
+                'adaptive_effort_steps', ((0, 9), (2, 7), (20, 6), (100, 5))
+            )
+        ))
         
         # Logging and notifications
         self.log_file: str = config_dict.get('log_file', 'image-squisher.log')
         self.log_verbosity: str = config_dict.get('log_verbosity', 'INFO').upper()
         self.enable_notifications: bool = config_dict.get('enable_notifications', True)
         
-        # Validate values
-        self._validate()
+        # Validate values (skipped under python -O, where inputs are trusted)
+        if __debug__:
+            self._validate()
     
     def _validate(self) -> None:
         """Validate configuration values."""
@@ -43,6 +78,10 @@ class Config:
             raise ValueError("threads must be >= 1")
         if not (0 <= self.min_improvement_pct <= 100):
             raise ValueError("min_improvement_pct must be between 0 and 100")
+        if self.min_file_size < 0:
+            raise ValueError("min_file_size must be >= 0")
+        if self.max_megapixels_in_flight < 0:
+            raise ValueError("max_megapixels_in_flight must be >= 0")
         if self.hang_timeout < 1:
             raise ValueError("hang_timeout must be >= 1")
         if not (1 <= self.jpegxl_quality <= 100):
@@ -53,25 +92,35 @@ class Config:
             raise ValueError("webp_method must be between 0 and 6")
         if self.conversion_timeout < 1:
             raise ValueError("conversion_timeout must be >= 1")
+        if self.timeout_per_mb <= 0:
+            raise ValueError("timeout_per_mb must be > 0")
+        if self.timeout_min_seconds < 1:
+            raise ValueError("timeout_min_seconds must be >= 1")
         if self.max_animated_frames < 1:
             raise ValueError("max_animated_frames must be >= 1")
+        if self.streaming_threshold_mp <= 0:
+            raise ValueError("streaming_threshold_mp must be > 0")
+        if not (0 <= self.streaming_effort <= 9):
+            raise ValueError("streaming_effort must be between 0 and 9")
+        if not (0 <= self.early_exit_ratio < 1):
+            raise ValueError("early_exit_ratio must be >= 0 and < 1")
+        if self.adaptive_effort and not self.adaptive_effort_steps:
+            raise ValueError("adaptive_effort_steps must not be empty when adaptive_effort is enabled")
+        for _, step_effort in self.adaptive_effort_steps:
+            if not (0 <= step_effort <= 9):
+                raise ValueError("adaptive_effort_steps efforts must be between 0 and 9")
         if self.log_verbosity not in ('DEBUG', 'INFO', 'WARNING', 'ERROR'):
             raise ValueError("log_verbosity must be one of: DEBUG, INFO, WARNING, ERROR")
-        
-        # Normalize skip_extensions to lowercase with dots
-        normalized = []
-        for ext in self.skip_extensions:
-            ext = ext.lower()
-            if not ext.startswith('.'):
-                ext = '.' + ext
-            normalized.append(ext)
-        self.skip_extensions = normalized
 
 
+@functools.lru_cache(maxsize=8)
 def load_config(config_path: Optional[Path] = None) -> Config:
     """
     Load configuration from a JSON file.
     
+    Results are cached per path since the config doesn't change during a run;
+    call load_config.cache_clear() to force a re-read.
+    
     Args:
         config_path: Path to config file. If None, looks for config.json in current directory.
         
@@ -86,8 +135,8 @@ def load_config(config_path: Optional[Path] = None) -> Config:
         return Config()
     
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config_dict = json.load(f)
+        # Single read + json.loads on bytes skips the text-mode incremental reader
+        config_dict = json.loads(config_path.read_bytes())
         # Remove _comments field if present (used for documentation only)
         config_dict.pop('_comments', None)
         return Config(config_dict)
@@ -107,14 +156,26 @@ def create_default_config(config_path: Path) -> None:
     default_config = {
         "threads": 1,
         "min_improvement_pct": 5.0,
+        "min_file_size": 4096,
         "hang_timeout": 300,
         "recursive": True,
-        "skip_extensions": [".webp", ".jxl"],
+        "deduplicate": False,
+        "max_megapixels_in_flight": 0,
+        "temp_dir": "",
+        "skip_extensions": [".webp", ".jxl", ".avif"],
         "jpegxl_quality": 100,
         "jpegxl_effort": 9,
         "webp_method": 6,
         "conversion_timeout": 300,
+        "timeout_per_mb": 10.0,
+        "timeout_min_seconds": 30,
         "max_animated_frames": 1000,
+        "streaming_threshold_mp": 30.0,
+        "streaming_effort": 8,
+        "also_try_webp_for_jpeg": False,
+        "early_exit_ratio": 0,
+        "adaptive_effort": False,
+        "adaptive_effort_steps": [[0, 9], [2, 7], [20, 6], [100, 5]],
         "log_file": "image-squisher.log",
         "log_verbosity": "INFO",
         "enable_notifications": True
@@ -1,8 +1,18 @@
 """Safe file operations and size comparison."""
 
+import errno
+import hashlib
 import os
+import shutil
+import stat
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from config_loader import Config
+from processor import convert_image, pnm_stream_size
 
 
 def get_file_size(filepath: Path) -> int:
@@ -21,12 +31,9 @@ def verify_file(filepath: Path) -> bool:
         True if file is valid, False otherwise
     """
     try:
-        if not filepath.exists():
-            return False
-        # Try to open and read a small portion
-        with open(filepath, 'rb') as f:
-            f.read(1)
-        return True
+        # A single stat() covers existence, type and non-emptiness
+        st = os.stat(filepath)
+        return stat.S_ISREG(st.st_mode) and st.st_size > 0
     except Exception:
         return False
 
@@ -37,7 +44,8 @@ def compare_and_keep_smallest(
     webp_path: Optional[Path],
     jxl_size: Optional[int],
     webp_size: Optional[int],
-    min_improvement_pct: Optional[float] = None
+    min_improvement_pct: Optional[float] = None,
+    original_size: Optional[int] = None
 ) -> Tuple[Path, str]:
     """
     Compare file sizes and determine which file to keep.
@@ -51,6 +59,7 @@ def compare_and_keep_smallest(
         webp_size: Size of WebP file in bytes
         min_improvement_pct: Minimum percentage improvement required to keep converted file.
                             If None, uses value from config.
+        original_size: Size of the original file in bytes. If None, it is read from disk.
         
     Returns:
         Tuple of (path_to_keep, format_name)
@@ -66,20 +75,15 @@ def compare_and_keep_smallest(
             # Fallback to default
             min_improvement_pct = 5.0
     
-    original_size = get_file_size(original_path)
-    
-    # Build list of available options
-    options = [('original', original_path, original_size)]
-    
-    if jxl_path and jxl_size is not None:
-        options.append(('jxl', jxl_path, jxl_size))
+    if original_size is None:
+        original_size = get_file_size(original_path)
     
-    if webp_path and webp_size is not None:
-        options.append(('webp', webp_path, webp_size))
-    
-    # Find the smallest
-    smallest = min(options, key=lambda x: x[2])
-    format_name, path_to_keep, size = smallest
+    # Find the smallest (ties go to the earlier option: original, then JXL, then WebP)
+    format_name, path_to_keep, size = 'original', original_path, original_size
+    if jxl_path and jxl_size is not None and jxl_size < size:
+        format_name, path_to_keep, size = 'jxl', jxl_path, jxl_size
+    if webp_path and webp_size is not None and webp_size < size:
+        format_name, path_to_keep, size = 'webp', webp_path, webp_size
     
     # If we're keeping a converted file, check if improvement meets threshold
     if format_name != 'original':
@@ -93,7 +97,63 @@ def compare_and_keep_smallest(
     return path_to_keep, format_name
 
 
-def safely_replace_file(original_path: Path, new_path: Path, target_extension: str) -> Path:
+def _move_file(source: str, destination: str) -> None:
+    """
+    Atomically move a file, copying it across filesystems if needed.
+    
+    A cross-device move (e.g. from a tmpfs temp_dir) is copied next to the
+    destination first, so the destination itself is still replaced atomically.
+    """
+    try:
+        os.replace(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        partial_path = destination + '.part'
+        try:
+            shutil.copyfile(source, partial_path)
+            os.replace(partial_path, destination)
+        except OSError:
+            cleanup_temp_files(Path(partial_path))
+            raise
+        os.unlink(source)
+
+
+def resolve_temp_dir(setting: str, image_path: Path, original_size: int, streaming_threshold_mp: Optional[float] = None) -> Path:
+    """
+    Pick the directory for an image's temporary conversion outputs.
+    
+    Args:
+        setting: The temp_dir config value: '' for the image's own folder,
+                 'auto' for /dev/shm when it exists and has room, or a directory path
+        image_path: Path to the image being converted
+        original_size: Size of the image in bytes
+        streaming_threshold_mp: Streaming threshold, for sizing the temporary PNM that
+                                large images are streamed to cjxl from.
+                                If None, the PNM is not accounted for.
+        
+    Returns:
+        Directory to write temporary files to
+    """
+    if not setting:
+        return image_path.parent
+    if setting == 'auto':
+        # RAM-backed: the losing conversion never touches the disk.
+        # Needs room for both outputs, which rarely exceed the original,
+        # plus the uncompressed PNM if the image is streamed to cjxl
+        needed = 2 * original_size
+        if streaming_threshold_mp is not None:
+            needed += pnm_stream_size(image_path, streaming_threshold_mp)
+        try:
+            if shutil.disk_usage('/dev/shm').free > needed:
+                return Path('/dev/shm')
+        except OSError:
+            pass
+        return image_path.parent
+    return Path(setting)
+
+
+def safely_replace_file(original_path: Path, new_path: Path, target_extension: str, new_size: Optional[int] = None) -> Path:
     """
     Safely replace the original file with a new file using atomic operations.
     Updates the file extension to match the format.
@@ -102,33 +162,44 @@ def safely_replace_file(original_path: Path, new_path: Path, target_extension: s
         original_path: Path to the original file
         new_path: Path to the new file that should replace it
         target_extension: Extension to use for the final file (e.g., '.webp', '.jxl')
+        new_size: Size of new_path in bytes if already known (skips re-verifying it on disk)
         
     Returns:
         Path to the final file (with correct extension), or original_path if replacement failed
     """
     try:
-        # Verify the new file is valid
-        if not verify_file(new_path):
+        # Reject empty output; a missing new file makes os.replace raise below.
+        # Only stat the file when the converter didn't already report its size.
+        if new_size is not None:
+            if new_size <= 0:
+                return original_path
+        elif not verify_file(new_path):
             return original_path
         
-        # Create the target path with the correct extension
-        target_path = original_path.parent / f"{original_path.stem}{target_extension}"
+        # Create the target path with the correct extension.
+        # Paths are built from the same strings, so plain string equality is
+        # enough (and avoids PurePath's normalizing __eq__).
+        original_str = os.fspath(original_path)
+        new_str = os.fspath(new_path)
+        target_str = os.path.splitext(original_str)[0] + target_extension
         
         # If target path is same as original (same extension), just replace directly
-        if target_path == original_path:
-            os.replace(new_path, original_path)
+        if target_str == original_str:
+            _move_file(new_str, original_str)
             return original_path
         
-        # Different extension: rename temp file to target path, then delete original
-        # First, rename temp file to target path (with correct extension)
-        if new_path != target_path:
-            os.replace(new_path, target_path)
+        # Different extension: move temp file to target path, then delete original
+        # First, move temp file to target path (with correct extension)
+        if new_str != target_str:
+            _move_file(new_str, target_str)
         
         # Delete the original file (it's been replaced by the converted version)
-        if original_path.exists() and original_path != target_path:
-            original_path.unlink()
+        try:
+            os.unlink(original_str)
+        except FileNotFoundError:
+            pass
         
-        return target_path
+        return Path(target_str)
     except Exception:
         return original_path
 
@@ -141,20 +212,48 @@ def cleanup_temp_files(*filepaths: Optional[Path]) -> None:
         *filepaths: Variable number of file paths to delete (None values are ignored)
     """
     for filepath in filepaths:
-        if filepath and filepath.exists():
-            try:
-                filepath.unlink()
-            except Exception:
-                pass
+        if filepath is None:
+            continue
+        # unlink reports a missing file itself, so no exists() check is needed
+        try:
+            os.unlink(filepath)
+        except OSError:
+            pass
 
 
-def process_image(image_path: Path, min_improvement_pct: Optional[float] = None) -> Tuple[bool, str, int, int]:
+def process_image(
+    image_path: Path,
+    min_improvement_pct: Optional[float] = None,
+    *,
+    original_size: Optional[int] = None,
+    min_file_size: Optional[int] = None,
+    timeout_per_mb: Optional[float] = None,
+    timeout_min_seconds: Optional[int] = None,
+    conversion_timeout: Optional[int] = None,
+    temp_dir: Optional[str] = None,
+    config: Optional[Config] = None
+) -> Tuple[bool, str, int, int]:
     """
     Process a single image: convert, compare, and keep smallest.
     
     Args:
         image_path: Path to the image to process
         min_improvement_pct: Minimum improvement percentage. If None, uses config value.
+        original_size: Size of the image in bytes if already known (e.g. from scheduling).
+                       If None, it is read from disk.
+        min_file_size: Files smaller than this (bytes) are kept without conversion.
+                       If None, uses config value.
+        timeout_per_mb: Conversion timeout in seconds per MB of original file.
+                        If None, uses config value.
+        timeout_min_seconds: Lower bound for the size-scaled conversion timeout.
+                             If None, uses config value.
+        conversion_timeout: Upper bound for the size-scaled conversion timeout.
+                            If None, uses config value.
+        temp_dir: Where to write temporary conversions ('' = next to the image,
+                  'auto' = /dev/shm when it has room). If None, uses config value.
+        config: Settings for the values above that are None and for the encoders
+                (pass the loaded config so --config is honored). If None,
+                config.json is loaded from its default location.
         
     Returns:
         Tuple of (success, format_kept, original_size, final_size)
@@ -163,43 +262,86 @@ def process_image(image_path: Path, min_improvement_pct: Optional[float] = None)
         original_size: Size of original file in bytes
         final_size: Size of final file in bytes
     """
-    from processor import convert_image, is_animated_gif
-    
     # Animated GIFs are now handled by convert_to_webp (converts to animated WebP)
     # JPEG XL doesn't support animation, so it will return None for animated GIFs
     
+    # At most one stat for the original; the size is reused for the rest of processing
+    if original_size is None:
+        original_size = get_file_size(image_path)
+    
     # Skip files already in optimized formats (JXL or WebP)
-    suffix_lower = image_path.suffix.lower()
+    suffix_lower = os.path.splitext(image_path)[1].lower()
     if suffix_lower in ('.jxl', '.webp'):
         # Already optimized, skip processing
-        original_size = get_file_size(image_path)
         format_name = 'jxl' if suffix_lower == '.jxl' else 'webp'
         return True, format_name, original_size, original_size
     
-    original_size = get_file_size(image_path)
-    temp_dir = image_path.parent
+    # Get settings from config if not provided; the same config goes to the encoders
+    if config is None:
+        try:
+            from config_loader import load_config
+            config = load_config()
+        except Exception:
+            # Fallback to defaults
+            config = Config()
+    if min_improvement_pct is None:
+        min_improvement_pct = config.min_improvement_pct
+    if min_file_size is None:
+        min_file_size = config.min_file_size
+    if timeout_per_mb is None:
+        timeout_per_mb = config.timeout_per_mb
+    if timeout_min_seconds is None:
+        timeout_min_seconds = config.timeout_min_seconds
+    if conversion_timeout is None:
+        conversion_timeout = config.conversion_timeout
+    if temp_dir is None:
+        temp_dir = config.temp_dir
+    
+    # Too small to be worth spawning the encoders for
+    if original_size < min_file_size:
+        return True, 'original', original_size, original_size
+    
+    # Scale the timeout with file size: small files fail fast, huge ones get more
+    # time, up to conversion_timeout
+    timeout = max(timeout_min_seconds, int(original_size / (1024 * 1024) * timeout_per_mb))
+    timeout = min(timeout, conversion_timeout)
     
     # Convert to both formats (in parallel)
-    jxl_path, webp_path, jxl_size, webp_size = convert_image(image_path, temp_dir, original_size)
+    jxl_path, webp_path, jxl_size, webp_size = convert_image(
+        image_path,
+        resolve_temp_dir(temp_dir, image_path, original_size, config.streaming_threshold_mp),
+        original_size,
+        timeout,
+        config=config,
+    )
+    
+    # Neither conversion is smaller - nothing to compare or replace
+    if ((jxl_size is None or jxl_size >= original_size)
+            and (webp_size is None or webp_size >= original_size)):
+        cleanup_temp_files(jxl_path, webp_path)
+        return True, 'original', original_size, original_size
     
     try:
         # Compare and determine which to keep
         path_to_keep, format_name = compare_and_keep_smallest(
-            image_path, jxl_path, webp_path, jxl_size, webp_size, min_improvement_pct
+            image_path, jxl_path, webp_path, jxl_size, webp_size, min_improvement_pct, original_size
         )
         
         # If we're keeping a converted file, replace the original
         final_path = image_path
+        final_size = original_size
         if format_name != 'original':
             # Determine the correct extension for the format
             if format_name == 'jxl':
                 target_extension = '.jxl'
+                final_size = jxl_size
             elif format_name == 'webp':
                 target_extension = '.webp'
+                final_size = webp_size
             else:
                 target_extension = image_path.suffix  # Fallback to original extension
             
-            final_path = safely_replace_file(image_path, path_to_keep, target_extension)
+            final_path = safely_replace_file(image_path, path_to_keep, target_extension, final_size)
             # Check if replacement failed
             # If we expected a different extension but got original_path back, it failed
             expected_path = image_path.parent / f"{image_path.stem}{target_extension}"
@@ -208,12 +350,14 @@ def process_image(image_path: Path, min_improvement_pct: Optional[float] = None)
                 format_name = 'original'
                 path_to_keep = image_path
                 final_path = image_path
+                final_size = original_size
                 cleanup_temp_files(jxl_path, webp_path)
             elif not final_path.exists():
                 # File doesn't exist - replacement failed
                 format_name = 'original'
                 path_to_keep = image_path
                 final_path = image_path
+                final_size = original_size
                 cleanup_temp_files(jxl_path, webp_path)
             else:
                 # Successfully kept a converted file - clean up the other converted file
@@ -227,8 +371,6 @@ def process_image(image_path: Path, min_improvement_pct: Optional[float] = None)
             # We're keeping the original, clean up converted files
             cleanup_temp_files(jxl_path, webp_path)
         
-        final_size = get_file_size(final_path)
-        
         return True, format_name, original_size, final_size
     
     except Exception as e:
@@ -236,3 +378,106 @@ def process_image(image_path: Path, min_improvement_pct: Optional[float] = None)
         cleanup_temp_files(jxl_path, webp_path)
         return False, 'original', original_size, original_size
 
+
+def _file_size_or_zero(filepath: Path) -> int:
+    """Get file size in bytes, or 0 if the file can't be stat'd."""
+    try:
+        return filepath.stat().st_size
+    except OSError:
+        return 0
+
+
+def _hash_file(filepath: Path) -> bytes:
+    """Hash a file's contents with BLAKE2b, reading it in 1 MiB chunks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def find_duplicates(paths: List[Path], sizes: List[int]) -> Dict[int, int]:
+    """
+    Find files with identical contents.
+    
+    Only files that share a size with another file are hashed, so a tree
+    without duplicates costs little more than the stats already done.
+    
+    Args:
+        paths: Paths of the images
+        sizes: Size of each image in bytes (same order as paths; 0 = unknown)
+        
+    Returns:
+        Dict mapping the index of each duplicate to the index of the first
+        file (in paths order) with the same contents
+    """
+    indices_by_size = defaultdict(list)
+    for index, size in enumerate(sizes):
+        if size > 0:
+            indices_by_size[size].append(index)
+    
+    duplicates = {}
+    for indices in indices_by_size.values():
+        if len(indices) < 2:
+            continue
+        first_by_digest = {}
+        for index in indices:
+            try:
+                digest = _hash_file(paths[index])
+            except OSError:
+                continue
+            first = first_by_digest.setdefault(digest, index)
+            if first != index:
+                duplicates[index] = first
+    
+    return duplicates
+
+
+def reuse_duplicate_result(
+    duplicate_path: Path,
+    source_path: Path,
+    source_success: bool,
+    source_format: str,
+    original_size: int
+) -> Tuple[bool, str, int, int]:
+    """
+    Give a duplicate file the same outcome as the identical file already processed.
+    
+    If the source was converted, its converted file is copied over the duplicate
+    instead of running the encoders again on the same bytes.
+    
+    Args:
+        duplicate_path: Path to the duplicate image
+        source_path: Original path of the identical image that was processed
+        source_success: Whether processing the source succeeded
+        source_format: Format kept for the source ('original', 'jxl' or 'webp')
+        original_size: Size of the duplicate in bytes
+        
+    Returns:
+        Tuple of (success, format_kept, original_size, final_size), as process_image
+    """
+    if not source_success:
+        # Same bytes would fail the same way
+        return False, 'original', original_size, original_size
+    
+    target_extension = '.' + source_format
+    if source_format == 'original' or os.path.splitext(duplicate_path)[1].lower() == target_extension:
+        # Kept as-is (or already in the kept format) - nothing to copy
+        return True, source_format, original_size, original_size
+    
+    converted_path = Path(os.path.splitext(os.fspath(source_path))[0] + target_extension)
+    temp_path = duplicate_path.with_name(f"{duplicate_path.name}.tmp{target_extension}")
+    try:
+        shutil.copyfile(converted_path, temp_path)
+        final_size = get_file_size(temp_path)
+    except OSError:
+        cleanup_temp_files(temp_path)
+        return False, 'original', original_size, original_size
+    
+    final_path = safely_replace_file(duplicate_path, temp_path, target_extension, final_size)
+    if final_path == duplicate_path:
+        # Replacement failed - keep original
+        cleanup_temp_files(temp_path)
+        return False, 'original', original_size, original_size
+    
+    return True, source_format, original_size, final_size
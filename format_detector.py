@@ -1,74 +1,139 @@
 """Format detection and image file scanning."""
 
+import functools
 import os
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Set, Tuple, Optional
+from typing import FrozenSet, Iterable, Iterator, List, Set, Tuple, Optional
 from PIL import Image
 
 # Common image extensions
-IMAGE_EXTENSIONS = {
+IMAGE_EXTENSIONS: FrozenSet[str] = frozenset({
     '.png', '.jpg', '.jpeg', '.jpe', '.jfif',
     '.tiff', '.tif', '.bmp', '.gif', '.webp',
     '.heic', '.heif', '.avif', '.jxl', '.jp2',
     '.ico', '.icns', '.tga', '.dds'
-}
+})
+
+
+# Leading-byte signatures for formats that can be identified without PIL
+IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n',                 # PNG
+    b'\xff\xd8\xff',                      # JPEG
+    b'GIF87a', b'GIF89a',                 # GIF
+    b'II*\x00', b'MM\x00*',               # TIFF (little/big endian)
+    b'BM',                                # BMP
+    b'\x00\x00\x01\x00',                  # ICO
+    b'\xff\x0a',                          # JPEG XL codestream
+    b'\x00\x00\x00\x0cJXL \r\n\x87\n',    # JPEG XL container
+)
+
+# Extensions whose files must start with one of IMAGE_SIGNATURES (or be WebP).
+# Anything else (HEIC/AVIF, JPEG 2000, TGA, ...) falls back to a PIL header parse,
+# since those depend on optional plugins or have no reliable magic bytes.
+SIGNATURE_EXTENSIONS: FrozenSet[str] = frozenset({
+    '.png', '.jpg', '.jpeg', '.jpe', '.jfif',
+    '.tiff', '.tif', '.bmp', '.gif', '.webp',
+    '.ico', '.jxl'
+})
 
 
 def is_image_file(filepath: Path) -> bool:
-    """Check if a file is a valid image by attempting to open it."""
+    """
+    Check if a file is a valid image without decoding its pixels.
+    
+    Common formats are identified by their leading magic bytes; other
+    formats fall back to PIL's header-only verify().
+    """
     try:
-        # Try to open and load a small portion to verify it's a valid image
+        if os.path.splitext(filepath)[1].lower() in SIGNATURE_EXTENSIONS:
+            with open(filepath, 'rb') as f:
+                header = f.read(12)
+            if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+                return True
+            return header.startswith(IMAGE_SIGNATURES)
+        
+        # verify() only parses headers; the full decode happens at conversion time
         with Image.open(filepath) as img:
-            # Load a small portion to verify the image is valid
-            # (verify() closes the image, so we just try to access properties)
-            img.load()
+            img.verify()
         return True
     except Exception:
         return False
 
 
-def scan_folder(folder_path: Path, recursive: bool = False, skip_extensions: Optional[List[str]] = None) -> List[Path]:
+@functools.lru_cache(maxsize=1)
+def _default_skip_extensions() -> FrozenSet[str]:
+    """Get the skip extensions from config, cached for the lifetime of the process."""
+    try:
+        from config_loader import load_config
+        config = load_config()
+        return frozenset(config.skip_extensions)
+    except Exception:
+        # Fallback to default if config can't be loaded
+        return frozenset({'.webp', '.jxl', '.avif'})
+
+
+def _walk_image_entries(folder_path: Path, recursive: bool, skip_extensions: Optional[Iterable[str]]) -> Iterator[Tuple[str, Path]]:
+    """Yield (path string, Path) for each image file, in directory walk order."""
+    # Use provided skip_extensions or default
+    if skip_extensions is None:
+        skip_extensions_set = _default_skip_extensions()
+    else:
+        skip_extensions_set = frozenset(ext.lower() for ext in skip_extensions)
+    
+    # Extensions that are both images and not skipped - one lookup per entry.
+    # Everything the walk loop touches is bound to a local (LOAD_FAST, not LOAD_GLOBAL).
+    active_extensions = IMAGE_EXTENSIONS - skip_extensions_set
+    is_image = is_image_file
+    
+    # Walk with os.scandir: DirEntry caches the file type from readdir, so
+    # non-image entries are rejected without a stat() or Path allocation
+    pending = [os.fspath(folder_path)]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    
+                    name = entry.name
+                    dot = name.rfind('.')
+                    if dot < 1:
+                        # No extension (or a bare dotfile such as '.png')
+                        continue
+                    if name[dot:].lower() not in active_extensions:
+                        continue
+                    
+                    filepath = Path(entry.path)
+                    if is_image(filepath):
+                        yield entry.path, filepath
+        except OSError:
+            # Unreadable directory - skip it rather than aborting the scan
+            continue
+
+
+def scan_folder(folder_path: Path, recursive: bool = False, skip_extensions: Optional[Iterable[str]] = None) -> List[Path]:
     """
     Scan a folder for image files.
-    Skips file types specified in skip_extensions (defaults to .webp and .jxl).
+    Skips file types specified in skip_extensions (defaults to .webp, .jxl and .avif).
     
     Args:
         folder_path: Path to the folder to scan
         recursive: If True, scan subdirectories recursively
-        skip_extensions: List of extensions to skip (e.g., ['.webp', '.jxl']). 
+        skip_extensions: Extensions to skip (e.g., ['.webp', '.jxl']). 
                         If None, uses default from config.
         
     Returns:
-        List of paths to valid image files
+        List of paths to valid image files, sorted by path
     """
-    image_files = []
-    
-    # Use provided skip_extensions or default
-    if skip_extensions is None:
-        try:
-            from config_loader import load_config
-            config = load_config()
-            skip_extensions_set = set(config.skip_extensions)
-        except Exception:
-            # Fallback to default if config can't be loaded
-            skip_extensions_set = {'.webp', '.jxl'}
-    else:
-        skip_extensions_set = {ext.lower() for ext in skip_extensions}
-    
-    if recursive:
-        pattern = '**/*'
-    else:
-        pattern = '*'
-    
-    for filepath in folder_path.glob(pattern):
-        if filepath.is_file() and filepath.suffix.lower() in IMAGE_EXTENSIONS:
-            # Skip specified file types
-            if filepath.suffix.lower() in skip_extensions_set:
-                continue
-            if is_image_file(filepath):
-                image_files.append(filepath)
-    
-    return sorted(image_files)
+    # Sorting on the plain path string avoids PurePath comparisons
+    image_files = list(_walk_image_entries(folder_path, recursive, skip_extensions))
+    image_files.sort(key=itemgetter(0))
+    return [filepath for _, filepath in image_files]
 
 
 def detect_formats(image_files: List[Path]) -> Set[str]:
@@ -81,8 +146,5 @@ def detect_formats(image_files: List[Path]) -> Set[str]:
     Returns:
         Set of file extensions (lowercase, with dot) found
     """
-    formats = set()
-    for filepath in image_files:
-        formats.add(filepath.suffix.lower())
-    return formats
+    return {os.path.splitext(filepath)[1].lower() for filepath in image_files}
 
@@ -2,33 +2,73 @@
 """Image compression tool - losslessly converts images to JPEG XL/WebP and keeps smallest."""
 
 import argparse
+import functools
+import os
 import sys
 import subprocess
 import shutil
 import logging
 import time
 import platform
-import threading
+import stat
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 from typing import List, Optional, Tuple
-from queue import Queue, Empty
+
+from xml.sax.saxutils import escape as xml_escape
 
 from format_detector import scan_folder, detect_formats
-from file_manager import process_image
+from file_manager import process_image, find_duplicates, reuse_duplicate_result, _file_size_or_zero
+from processor import MegapixelBudget, set_megapixel_budget, set_cjxl_threads, cjxl_threads_for_workers, _check_cjxl_available
 from config_loader import load_config, Config
 
 
+# Optional in-process Windows toasts (pip install winrt-Windows.UI.Notifications
+# winrt-Windows.Data.Xml.Dom); without them, toasts go through PowerShell
+_win_notifications = None
+_win_xml = None
+if platform.system() == 'Windows':
+    try:
+        import winrt.windows.ui.notifications as _win_notifications
+        import winrt.windows.data.xml.dom as _win_xml
+    except ImportError:
+        _win_notifications = None
+        _win_xml = None
+
+# Toast XML used with the winrt bindings
+_TOAST_XML_TEMPLATE = (
+    '<toast><visual><binding template="ToastText02">'
+    '<text id="1">{title}</text><text id="2">{message}</text>'
+    '</binding></visual></toast>'
+)
+
+# PowerShell one-liner that shows a Windows toast notification
+_PS_TOAST_TEMPLATE = (
+    '[Windows.UI.Notifications.ToastNotificationManager, Windows.UI.Notifications, ContentType = WindowsRuntime] > $null;'
+    ' $template = [Windows.UI.Notifications.ToastNotificationManager]::GetTemplateContent([Windows.UI.Notifications.ToastTemplateType]::ToastText02);'
+    ' $text = $template.GetElementsByTagName("text");'
+    ' $text[0].AppendChild($template.CreateTextNode("{title}")) > $null;'
+    ' $text[1].AppendChild($template.CreateTextNode("{message}")) > $null;'
+    ' $toast = [Windows.UI.Notifications.ToastNotification]::new($template);'
+    ' [Windows.UI.Notifications.ToastNotificationManager]::CreateToastNotifier("Image Squisher").Show($toast)'
+)
+
+
+_BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+
 def format_bytes(bytes: int) -> str:
     """Format bytes as human-readable string."""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes < 1024.0:
-            return f"{bytes:.2f} {unit}"
-        bytes /= 1024.0
-    return f"{bytes:.2f} TB"
+    # Unit index is floor(log1024(|bytes|)), read off the integer bit length
+    magnitude = abs(int(bytes))
+    unit = min((magnitude.bit_length() - 1) // 10, 4) if magnitude else 0
+    return f"{bytes / (1 << (10 * unit)):.2f} {_BYTE_UNITS[unit]}"
 
 
+@functools.lru_cache(maxsize=1)
 def check_terminal_notifier() -> Optional[str]:
-    """Check if terminal-notifier is available and return its path (macOS only)."""
+    """Check if terminal-notifier is available and return its path (macOS only, cached)."""
     system = platform.system()
     if system != 'Darwin':
         # terminal-notifier is macOS-only
@@ -50,6 +90,95 @@ def check_terminal_notifier() -> Optional[str]:
     return None
 
 
+@functools.lru_cache(maxsize=1)
+def _find_powershell() -> Optional[str]:
+    """Find the PowerShell executable (Windows only, cached)."""
+    return shutil.which('powershell')
+
+
+def _notify_macos(title: str, message: str, sound: str) -> bool:
+    """Send a notification through terminal-notifier."""
+    notifier = check_terminal_notifier()
+    if not notifier:
+        return False
+    try:
+        subprocess.run(
+            [
+                notifier,
+                '-title', title,
+                '-message', message,
+                '-sound', sound
+            ],
+            capture_output=True,
+            timeout=5
+        )
+        return True
+    except Exception:
+        return False
+
+
+def _notify_windows(title: str, message: str, sound: str) -> bool:
+    """Show a Windows toast (in-process via winrt if installed, else PowerShell)."""
+    if _win_notifications is not None:
+        try:
+            # Show the toast in-process instead of spawning PowerShell
+            toast_xml = _win_xml.XmlDocument()
+            toast_xml.load_xml(_TOAST_XML_TEMPLATE.format(
+                title=xml_escape(title),
+                message=xml_escape(message)
+            ))
+            notifier = _win_notifications.ToastNotificationManager.create_toast_notifier('Image Squisher')
+            notifier.show(_win_notifications.ToastNotification(toast_xml))
+            return True
+        except Exception:
+            # Fall through to PowerShell
+            pass
+    try:
+        # Use Windows toast notifications via PowerShell
+        # Escape message for PowerShell
+        escaped_title = title.replace('"', '`"')
+        escaped_message = message.replace('"', '`"').replace('\n', '`n')
+        ps_command = _PS_TOAST_TEMPLATE.format(title=escaped_title, message=escaped_message)
+        powershell = _find_powershell()
+        if not powershell:
+            return False
+        subprocess.run(
+            [powershell, '-Command', ps_command],
+            capture_output=True,
+            timeout=5
+        )
+        return True
+    except Exception:
+        return False
+
+
+def _notify_linux(title: str, message: str, sound: str) -> bool:
+    """Send a notification through notify-send."""
+    try:
+        # Try notify-send (common on Linux)
+        subprocess.run(
+            ['notify-send', title, message],
+            capture_output=True,
+            timeout=5
+        )
+        return True
+    except Exception:
+        return False
+
+
+def _notify_unsupported(title: str, message: str, sound: str) -> bool:
+    """No notification backend on this platform."""
+    return False
+
+
+# The platform can't change during a run, so pick the backend once at import
+_NOTIFY = {
+    'Darwin': _notify_macos,
+    'Windows': _notify_windows,
+    'Linux': _notify_linux,
+}.get(platform.system(), _notify_unsupported)
+
+
 def send_notification(title: str, message: str, sound: str = 'default', enabled: bool = True) -> bool:
     """
     Send a notification (macOS: terminal-notifier, Windows: toast, Linux: notify-send).
@@ -65,59 +194,7 @@ def send_notification(title: str, message: str, sound: str = 'default', enabled:
     """
     if not enabled:
         return False
-    
-    system = platform.system()
-    
-    if system == 'Darwin':  # macOS
-        notifier = check_terminal_notifier()
-        if not notifier:
-            return False
-        try:
-            subprocess.run(
-                [
-                    notifier,
-                    '-title', title,
-                    '-message', message,
-                    '-sound', sound
-                ],
-                capture_output=True,
-                timeout=5
-            )
-            return True
-        except Exception:
-            return False
-    
-    elif system == 'Windows':  # Windows
-        try:
-            # Use Windows toast notifications via PowerShell
-            # Escape message for PowerShell
-            escaped_title = title.replace('"', '`"')
-            escaped_message = message.replace('"', '`"').replace('\n', '`n')
-            ps_command = f'[Windows.UI.Notifications.ToastNotificationManager, Windows.UI.Notifications, ContentType = WindowsRuntime] > $null; $template = [Windows.UI.Notifications.ToastNotificationManager]::GetTemplateContent([Windows.UI.Notifications.ToastTemplateType]::ToastText02); $text = $template.GetElementsByTagName("text"); $text[0].AppendChild($template.CreateTextNode("{escaped_title}")) > $null; $text[1].AppendChild($template.CreateTextNode("{escaped_message}")) > $null; $toast = [Windows.UI.Notifications.ToastNotification]::new($template); [Windows.UI.Notifications.ToastNotificationManager]::CreateToastNotifier("Image Squisher").Show($toast)'
-            subprocess.run(
-                ['powershell', '-Command', ps_command],
-                capture_output=True,
-                timeout=5,
-                shell=True
-            )
-            return True
-        except Exception:
-            # Fallback: try win10toast if available, or just return False
-            return False
-    
-    elif system == 'Linux':  # Linux
-        try:
-            # Try notify-send (common on Linux)
-            subprocess.run(
-                ['notify-send', title, message],
-                capture_output=True,
-                timeout=5
-            )
-            return True
-        except Exception:
-            return False
-    
-    return False
+    return _NOTIFY(title, message, sound)
 
 
 def setup_logging(log_file: Optional[str] = None, log_verbosity: str = 'INFO') -> logging.Logger:
@@ -149,7 +226,9 @@ def setup_logging(log_file: Optional[str] = None, log_verbosity: str = 'INFO') -
     logger = logging.getLogger('image-squisher')
     logger.setLevel(log_level)
     
-    # Remove existing handlers
+    # Remove existing handlers (closing them releases the log file)
+    for handler in logger.handlers:
+        handler.close()
     logger.handlers.clear()
     
     # File handler (uses configured verbosity)
@@ -172,6 +251,18 @@ def setup_logging(log_file: Optional[str] = None, log_verbosity: str = 'INFO') -
     return logger
 
 
+def _init_worker(
+    log_file: Optional[str],
+    log_verbosity: str,
+    megapixel_budget: Optional[MegapixelBudget] = None,
+    cjxl_threads: Optional[int] = None,
+) -> None:
+    """Set up logging, the shared megapixel budget and cjxl threads in a worker process (spawned workers don't inherit them)."""
+    set_megapixel_budget(megapixel_budget)
+    set_cjxl_threads(cjxl_threads)
+    setup_logging(log_file, log_verbosity)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Losslessly compress images by converting to JPEG XL/WebP and keeping the smallest file.'
@@ -192,7 +283,8 @@ def main():
         help='Path to config file (default: config.json in current directory)'
     )
     parser.add_argument(
-        '--workers',
+        '--workers', '--jobs',
+        dest='workers',
         type=int,
         default=None,
         help='Number of parallel workers (overrides config.threads, default: number of CPU cores)'
@@ -202,11 +294,14 @@ def main():
     
     folder_path = Path(args.folder)
     
-    if not folder_path.exists():
+    # One stat() answers both "does it exist" and "is it a directory"
+    try:
+        folder_mode = folder_path.stat().st_mode
+    except OSError:
         print(f"Error: Folder '{folder_path}' does not exist.", file=sys.stderr)
         sys.exit(1)
     
-    if not folder_path.is_dir():
+    if not stat.S_ISDIR(folder_mode):
         print(f"Error: '{folder_path}' is not a directory.", file=sys.stderr)
         sys.exit(1)
     
@@ -219,6 +314,15 @@ def main():
         print("Using default configuration.", file=sys.stderr)
         config = Config()
     
+    # A missing temp directory would make every conversion fail, one image at a time
+    if config.temp_dir not in ('', 'auto'):
+        if not os.path.isdir(config.temp_dir):
+            print(f"Error: temp_dir '{config.temp_dir}' is not an existing directory.", file=sys.stderr)
+            sys.exit(1)
+        if not os.access(config.temp_dir, os.W_OK):
+            print(f"Error: temp_dir '{config.temp_dir}' is not writable.", file=sys.stderr)
+            sys.exit(1)
+    
     # Set up logging
     logger = setup_logging(config.log_file, config.log_verbosity)
     
@@ -239,12 +343,12 @@ def main():
         sys.exit(0)
     
     # Detect and report formats
+    n_total = len(image_files)
     formats = detect_formats(image_files)
-    print(f"Found {len(image_files)} image file(s)")
+    print(f"Found {n_total} image file(s)")
     print(f"Formats detected: {', '.join(sorted(formats))}")
     
     # Check if JPEG XL support is available (via libjxl command-line tool)
-    from processor import _check_cjxl_available
     cjxl_path = _check_cjxl_available()
     
     if not cjxl_path:
@@ -271,132 +375,146 @@ def main():
         if config.threads > 1:
             num_workers = config.threads
         else:
-            num_workers = min(multiprocessing.cpu_count(), len(image_files))
+            num_workers = min(multiprocessing.cpu_count(), n_total)
     
     if num_workers < 1:
         num_workers = 1
-    if num_workers > len(image_files):
-        num_workers = len(image_files)
+    if num_workers > n_total:
+        num_workers = n_total
     
     print(f"Using {num_workers} parallel worker(s)")
     print()
     
     # Process images in parallel
-    total_original = 0
-    total_final = 0
-    results = {'original': 0, 'jxl': 0, 'webp': 0}
+    # Per-image outcomes; totals are reduced once after processing finishes
+    original_sizes: List[int] = []
+    final_sizes: List[int] = []
+    kept_formats: List[str] = []
     errors = 0
-    start_time = time.time()
-    last_progress_time = time.time()
+    # Monotonic clock: hang detection must not be confused by wall-clock (NTP) adjustments
+    start_time = time.monotonic()
+    last_progress_time = start_time
     hang_timeout = config.hang_timeout
     
-    # Thread-safe counters and locks
-    results_lock = threading.Lock()
-    completed_count = [0]  # Use list for mutable reference
+    # One stat per file, reused for scheduling, duplicate detection and processing
+    sizes = [_file_size_or_zero(image_path) for image_path in image_files]
     
-    def process_worker(image_queue: Queue, result_queue: Queue):
-        """Worker thread that processes images from the queue."""
-        while True:
-            item = image_queue.get()
-            if item is None:  # Poison pill
-                break
-            
-            index, image_path = item
-            try:
-                success, format_kept, original_size, final_size = process_image(image_path)
-                result_queue.put((index, image_path, success, format_kept, original_size, final_size, None))
-            except Exception as e:
-                # Log exception with full traceback here where exception context exists
-                error_msg = f"Exception processing {image_path.name}: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                logger.error(f"Error in folder: {image_path.parent}")
-                result_queue.put((index, image_path, False, 'original', 0, 0, error_msg))
-            finally:
-                image_queue.task_done()
+    # Identical files are encoded once; the copies reuse the first one's result
+    duplicates = find_duplicates(image_files, sizes) if config.deduplicate else {}
+    if duplicates:
+        print(f"Found {len(duplicates)} duplicate file(s), each will reuse the result of an identical image")
+        print()
     
     if num_workers > 1:
-        # Use threading for parallel processing
-        image_queue = Queue()
-        result_queue = Queue()
-        
-        # Start worker threads
-        workers = []
-        for _ in range(num_workers):
-            worker = threading.Thread(target=process_worker, args=(image_queue, result_queue))
-            worker.daemon = True
-            worker.start()
-            workers.append(worker)
-        
-        # Add all images to queue
-        for i, image_path in enumerate(image_files):
-            image_queue.put((i, image_path))
-        
-        # Collect results as they complete with hang detection
+        # Use a process pool: Pillow's WebP encode releases the GIL, but image
+        # decoding, mode conversion and the rest of each image's Python work
+        # hold it, so threads in one process would still serialize on those
         results_dict = {}
         hang_check_interval = 60  # Check for hangs every 60 seconds
-        last_hang_check = time.time()
+        # Shared across workers so several huge images can't be encoded at once
+        megapixel_budget = None
+        if config.max_megapixels_in_flight > 0:
+            megapixel_budget = MegapixelBudget(config.max_megapixels_in_flight)
         
-        while len(results_dict) < len(image_files):
-            try:
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(
+                config.log_file,
+                config.log_verbosity,
+                megapixel_budget,
+                cjxl_threads_for_workers(num_workers),
+            ),
+        ) as executor:
+            # Hand workers the already-loaded settings instead of having each
+            # process re-read config.json (which would also ignore --config)
+            worker = functools.partial(process_image, config=config)
+            # Longest-processing-time first: submit the largest files first so no
+            # worker is left grinding through a huge image after the rest go idle
+            submit_order = sorted(
+                (i for i in range(n_total) if i not in duplicates),
+                key=sizes.__getitem__,
+                reverse=True
+            )
+            # Workers reuse these sizes; 0 (stat failed) makes the worker stat again
+            future_to_index = {
+                executor.submit(worker, image_files[i], original_size=sizes[i] or None): i
+                for i in submit_order
+            }
+            pending = set(future_to_index)
+            
+            while pending:
                 # Use timeout to periodically check for hangs
                 timeout = min(hang_timeout, hang_check_interval)
-                index, image_path, success, format_kept, original_size, final_size, error_msg = result_queue.get(timeout=timeout)
-                results_dict[index] = (image_path, success, format_kept, original_size, final_size, error_msg)
-                completed_count[0] += 1
-                last_progress_time = time.time()
-                last_hang_check = time.time()
-            except Empty:
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    index = future_to_index[future]
+                    image_path = image_files[index]
+                    try:
+                        success, format_kept, original_size, final_size = future.result()
+                        results_dict[index] = (image_path, success, format_kept, original_size, final_size, None)
+                    except Exception as e:
+                        # The worker's traceback is chained onto the re-raised exception
+                        error_msg = f"Exception processing {image_path.name}: {str(e)}"
+                        logger.error(error_msg, exc_info=True)
+                        logger.error(f"Error in folder: {image_path.parent}")
+                        results_dict[index] = (image_path, False, 'original', 0, 0, error_msg)
+                
+                if done:
+                    last_progress_time = time.monotonic()
+                    continue
+                
                 # Timeout occurred - check for potential hang
-                current_time = time.time()
+                current_time = time.monotonic()
                 time_since_progress = current_time - last_progress_time
                 
                 if time_since_progress > hang_timeout:
                     # Potential hang detected
-                    # Find which images are still being processed
-                    processed_indices = set(results_dict.keys())
-                    remaining_indices = [i for i in range(len(image_files)) if i not in processed_indices]
-                    
-                    if remaining_indices:
-                        # Report the first remaining image as potentially stuck
-                        stuck_index = remaining_indices[0]
-                        stuck_image = image_files[stuck_index]
-                        error_msg = f"Potential hang detected! No progress for {time_since_progress:.0f} seconds"
-                        logger.error(error_msg)
-                        logger.error(f"Current folder: {stuck_image.parent}")
-                        logger.error(f"Stuck on file: {stuck_image.name}")
-                        logger.error(f"Remaining images: {len(remaining_indices)}")
-                        send_notification(
-                            'Image Squisher - Hang Detected',
-                            f"Script may be hung processing:\n{stuck_image.parent}\n\nFile: {stuck_image.name}\n\nNo progress for {time_since_progress:.0f}s",
-                            'Basso',
-                            config.enable_notifications
-                        )
-                        print(f"\n⚠ WARNING: Potential hang detected! Check log file for details.")
-                        print(f"   Current folder: {stuck_image.parent}")
-                        print(f"   Stuck on file: {stuck_image.name}")
-                        print(f"   No progress for {time_since_progress:.0f} seconds")
-                        # Reset last_progress_time to avoid spamming notifications
-                        last_progress_time = current_time
-                
-                # Continue waiting for results
-                continue
+                    # Report the first image a worker is actually running as potentially stuck
+                    remaining_indices = sorted(future_to_index[future] for future in pending)
+                    running_indices = sorted(future_to_index[future] for future in pending if future.running())
+                    stuck_index = (running_indices or remaining_indices)[0]
+                    stuck_image = image_files[stuck_index]
+                    error_msg = f"Potential hang detected! No progress for {time_since_progress:.0f} seconds"
+                    logger.error(error_msg)
+                    logger.error(f"Current folder: {stuck_image.parent}")
+                    logger.error(f"Stuck on file: {stuck_image.name}")
+                    logger.error(f"Remaining images: {len(remaining_indices)}")
+                    send_notification(
+                        'Image Squisher - Hang Detected',
+                        f"Script may be hung processing:\n{stuck_image.parent}\n\nFile: {stuck_image.name}\n\nNo progress for {time_since_progress:.0f}s",
+                        'Basso',
+                        config.enable_notifications
+                    )
+                    print(f"\n⚠ WARNING: Potential hang detected! Check log file for details.")
+                    print(f"   Current folder: {stuck_image.parent}")
+                    print(f"   Stuck on file: {stuck_image.name}")
+                    print(f"   No progress for {time_since_progress:.0f} seconds")
+                    # Reset last_progress_time to avoid spamming notifications
+                    last_progress_time = current_time
         
-        # Stop workers
-        for _ in range(num_workers):
-            image_queue.put(None)
-        for worker in workers:
-            worker.join()
+        # Duplicates copy the converted file of the identical image processed above
+        for index, source_index in duplicates.items():
+            source_path, source_success, source_format = results_dict[source_index][:3]
+            results_dict[index] = (
+                image_files[index],
+                *reuse_duplicate_result(image_files[index], source_path, source_success, source_format, sizes[index]),
+                None
+            )
         
         # Process results in order
-        for i in range(len(image_files)):
+        for i in range(n_total):
             image_path, success, format_kept, original_size, final_size, error_msg = results_dict[i]
+            name = image_path.name
+            parent = image_path.parent
             
-            print(f"[{i+1}/{len(image_files)}] Processing: {image_path.name}", end=' ... ', flush=True)
+            print(f"[{i+1}/{n_total}] Processing: {name}", end=' ... ', flush=True)
             
             if success:
-                total_original += original_size
-                total_final += final_size
-                results[format_kept] += 1
+                original_sizes.append(original_size)
+                final_sizes.append(final_size)
+                kept_formats.append(format_kept)
                 
                 savings = original_size - final_size
                 savings_pct = (savings / original_size * 100) if original_size > 0 else 0
@@ -411,55 +529,67 @@ def main():
                     logger.error(error_msg)
                     send_notification(
                         'Image Squisher - Error',
-                        f"Error processing:\n{image_path.name}\n\nFolder: {image_path.parent}",
+                        f"Error processing:\n{name}\n\nFolder: {parent}",
                         'Basso',
                         config.enable_notifications
                     )
                 else:
-                    logger.warning(f"Failed to process {image_path.name}, kept original")
+                    logger.warning(f"Failed to process {name}, kept original")
                     send_notification(
                         'Image Squisher - Error',
-                        f"Error processing:\n{image_path.name}\n\nFolder: {image_path.parent}",
+                        f"Error processing:\n{name}\n\nFolder: {parent}",
                         'Basso',
                         config.enable_notifications
                     )
                 print(f"ERROR (kept original)")
     else:
         # Single-threaded processing (original behavior)
+        # (success, format_kept) per index, for duplicates of already-processed files
+        outcomes = {}
         for i, image_path in enumerate(image_files, 1):
-            current_time = time.time()
+            name = image_path.name
+            parent = image_path.parent
             
             # Check for potential hang (no progress for hang_timeout seconds)
-            if current_time - last_progress_time > hang_timeout:
+            if time.monotonic() - last_progress_time > hang_timeout:
                 error_msg = f"Potential hang detected! Last processed: {image_files[i-2].name if i > 1 else 'none'}"
                 logger.error(error_msg)
-                logger.error(f"Current folder: {image_path.parent}")
-                logger.error(f"Stuck on file: {image_path.name}")
+                logger.error(f"Current folder: {parent}")
+                logger.error(f"Stuck on file: {name}")
                 send_notification(
                     'Image Squisher - Hang Detected',
-                    f"Script may be hung processing:\n{image_path.parent}\n\nFile: {image_path.name}",
+                    f"Script may be hung processing:\n{parent}\n\nFile: {name}",
                     'Basso',
                     config.enable_notifications
                 )
                 print(f"\n⚠ WARNING: Potential hang detected! Check log file for details.")
-                print(f"   Current folder: {image_path.parent}")
-                print(f"   Stuck on file: {image_path.name}")
+                print(f"   Current folder: {parent}")
+                print(f"   Stuck on file: {name}")
                 # Continue processing but log the issue
             
-            print(f"[{i}/{len(image_files)}] Processing: {image_path.name}", end=' ... ', flush=True)
+            print(f"[{i}/{n_total}] Processing: {name}", end=' ... ', flush=True)
             
             try:
-                process_start = time.time()
-                success, format_kept, original_size, final_size = process_image(image_path)
-                process_duration = time.time() - process_start
+                index = i - 1
+                if index in duplicates:
+                    source_index = duplicates[index]
+                    source_success, source_format = outcomes.get(source_index, (False, 'original'))
+                    success, format_kept, original_size, final_size = reuse_duplicate_result(
+                        image_path, image_files[source_index], source_success, source_format, sizes[index]
+                    )
+                else:
+                    success, format_kept, original_size, final_size = process_image(
+                        image_path, original_size=sizes[index] or None, config=config
+                    )
+                outcomes[index] = (success, format_kept)
                 
                 # Update last progress time
-                last_progress_time = time.time()
+                last_progress_time = time.monotonic()
             
                 if success:
-                    total_original += original_size
-                    total_final += final_size
-                    results[format_kept] += 1
+                    original_sizes.append(original_size)
+                    final_sizes.append(final_size)
+                    kept_formats.append(format_kept)
                     
                     savings = original_size - final_size
                     savings_pct = (savings / original_size * 100) if original_size > 0 else 0
@@ -468,37 +598,41 @@ def main():
                           f"-{format_bytes(savings)} / -{savings_pct:.1f}%)")
                 else:
                     errors += 1
-                    logger.warning(f"Failed to process {image_path.name}, kept original")
+                    logger.warning(f"Failed to process {name}, kept original")
                     print(f"ERROR (kept original)")
                     # Send notification for conversion failures
                     send_notification(
                         'Image Squisher - Error',
-                        f"Error processing:\n{image_path.name}\n\nFolder: {image_path.parent}",
+                        f"Error processing:\n{name}\n\nFolder: {parent}",
                         'Basso',
                         config.enable_notifications
                     )
             except Exception as e:
                 errors += 1
-                error_msg = f"Exception processing {image_path.name}: {str(e)}"
+                error_msg = f"Exception processing {name}: {str(e)}"
                 logger.error(error_msg, exc_info=True)
-                logger.error(f"Error in folder: {image_path.parent}")
+                logger.error(f"Error in folder: {parent}")
                 print(f"ERROR (kept original)")
                 
                 # Send notification for exceptions
                 send_notification(
                     'Image Squisher - Error',
-                    f"Error processing:\n{image_path.name}\n\nFolder: {image_path.parent}",
+                    f"Error processing:\n{name}\n\nFolder: {parent}",
                     'Basso',
                     config.enable_notifications
                 )
     
-    total_duration = time.time() - start_time
+    total_duration = time.monotonic() - start_time
+    
+    total_original = sum(original_sizes)
+    total_final = sum(final_sizes)
+    results = Counter(kept_formats)
     
     print()
     print("=" * 60)
     print("Summary:")
-    print(f"  Total images processed: {len(image_files)}")
-    print(f"  Successful: {len(image_files) - errors}")
+    print(f"  Total images processed: {n_total}")
+    print(f"  Successful: {n_total - errors}")
     print(f"  Errors: {errors}")
     print()
     print("  Format distribution:")
@@ -516,7 +650,7 @@ def main():
     
     # Log summary
     logger.info("=" * 60)
-    logger.info(f"Summary: {len(image_files)} processed, {errors} errors, {total_duration:.1f}s")
+    logger.info(f"Summary: {n_total} processed, {errors} errors, {total_duration:.1f}s")
     logger.info(f"Saved: {format_bytes(savings)} ({savings_pct:.1f}%)")
     
     # Send completion notification
@@ -524,14 +658,14 @@ def main():
         if errors > 0:
             send_notification(
                 'Image Squisher - Completed with Errors',
-                f"Processed {len(image_files)} images\n{errors} errors\nSaved: {format_bytes(savings)} ({savings_pct:.1f}%)",
+                f"Processed {n_total} images\n{errors} errors\nSaved: {format_bytes(savings)} ({savings_pct:.1f}%)",
                 'Glass',
                 config.enable_notifications
             )
         else:
             send_notification(
                 'Image Squisher - Completed',
-                f"Processed {len(image_files)} images\nSaved: {format_bytes(savings)} ({savings_pct:.1f}%)",
+                f"Processed {n_total} images\nSaved: {format_bytes(savings)} ({savings_pct:.1f}%)",
                 'Ping',
                 config.enable_notifications
             )
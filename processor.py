@@ -1,15 +1,109 @@
 """Image conversion to JPEG XL and WebP formats."""
 
+import contextlib
+import functools
 import io
 import logging
+import multiprocessing
+import os
 import subprocess
 import shutil
 import platform
-import threading
+import signal
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple, Union
 from PIL import Image
 
+from config_loader import Config
+
+
+# Extensions cjxl can transcode losslessly (bit-exact JPEG reconstruction)
+JPEG_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.jpe', '.jfif'})
+
+
+class MegapixelBudget:
+    """
+    Cap the total megapixels being encoded at once across worker processes.
+    
+    Encoder memory grows with image area, so several huge images landing on
+    workers at the same time can exhaust RAM. Create the budget in the parent
+    and pass it to each worker (see set_megapixel_budget) before they start.
+    """
+    
+    def __init__(self, limit: float):
+        self.limit = limit
+        self._in_flight = multiprocessing.Value('d', 0.0, lock=False)
+        self._condition = multiprocessing.Condition()
+    
+    @contextlib.contextmanager
+    def reserve(self, megapixels: float) -> Iterator[None]:
+        """Block until megapixels fit in the budget, and hold them for the duration."""
+        with self._condition:
+            # An image larger than the whole budget still runs, but only on its own
+            while self._in_flight.value > 0 and self._in_flight.value + megapixels > self.limit:
+                self._condition.wait()
+            self._in_flight.value += megapixels
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight.value -= megapixels
+                self._condition.notify_all()
+
+
+# Budget shared with the other worker processes; None = unlimited
+_megapixel_budget: Optional[MegapixelBudget] = None
+
+
+def set_megapixel_budget(budget: Optional[MegapixelBudget]) -> None:
+    """Set the megapixel budget used by convert_image in this process."""
+    global _megapixel_budget
+    _megapixel_budget = budget
+
+
+def _default_config() -> Config:
+    """Load config.json from its default location, falling back to built-in defaults."""
+    from config_loader import load_config
+    try:
+        return load_config()
+    except Exception:
+        return Config()
+
+
+# Threads each cjxl run may use (None = let cjxl use every core)
+_cjxl_threads: Optional[int] = None
+
+
+def set_cjxl_threads(threads: Optional[int]) -> None:
+    """Set the --num_threads passed to cjxl by convert_to_jpegxl in this process."""
+    global _cjxl_threads
+    _cjxl_threads = threads
+
+
+def cjxl_threads_for_workers(num_workers: int) -> Optional[int]:
+    """
+    Split the CPU cores between concurrent worker processes.
+    
+    Args:
+        num_workers: Number of processes encoding images at the same time
+        
+    Returns:
+        Threads per cjxl run, or None when a single worker can use every core
+    """
+    if num_workers <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // num_workers)
+
+
+def _image_megapixels(image_path: Path) -> float:
+    """Get an image's size in megapixels from its header (0 if unreadable)."""
+    try:
+        with Image.open(image_path) as img:
+            return img.width * img.height / 1_000_000
+    except Exception:
+        return 0.0
+
 
 def is_animated_gif(image_path: Path) -> bool:
     """
@@ -39,8 +133,9 @@ def is_animated_gif(image_path: Path) -> bool:
         return False
 
 
+@functools.lru_cache(maxsize=1)
 def _check_cjxl_available() -> Optional[str]:
-    """Check if cjxl command is available and return its path."""
+    """Check if cjxl command is available and return its path (cached per process)."""
     # First try shutil.which (cross-platform)
     cjxl_path = shutil.which('cjxl')
     if cjxl_path and Path(cjxl_path).exists():
@@ -75,7 +170,220 @@ def _check_cjxl_available() -> Optional[str]:
     return None
 
 
-def convert_to_jpegxl(image_path: Path, output_path: Path, quality: Optional[int] = None, effort: Optional[int] = None, timeout: Optional[int] = None) -> Optional[int]:
+@functools.lru_cache(maxsize=1)
+def _check_cwebp_available() -> Optional[str]:
+    """Check if libwebp's cwebp command is available and return its path (cached per process)."""
+    cwebp_path = shutil.which('cwebp')
+    if cwebp_path and Path(cwebp_path).exists():
+        return cwebp_path
+    
+    system = platform.system()
+    if system == 'Darwin':  # macOS
+        cwebp_paths = [
+            Path('/opt/homebrew/bin/cwebp'),
+            Path('/usr/local/bin/cwebp'),
+        ]
+    elif system == 'Windows':
+        cwebp_paths = [
+            Path.home() / 'AppData' / 'Local' / 'Programs' / 'cwebp.exe',
+            Path('C:/Program Files/libwebp/bin/cwebp.exe'),
+        ]
+    else:  # Linux
+        cwebp_paths = [
+            Path('/usr/local/bin/cwebp'),
+            Path('/usr/bin/cwebp'),
+        ]
+    
+    for path in cwebp_paths:
+        if path.exists():
+            return str(path)
+    
+    return None
+
+
+# Source formats cwebp can read itself (PPM/PGM for the shared streaming PNM);
+# anything else is encoded through Pillow
+CWEBP_INPUT_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.ppm', '.pgm'})
+
+_POSIX = os.name == 'posix'
+
+
+def _kill_process_tree(proc: subprocess.Popen) -> None:
+    """Kill an encoder started by _run_encoder (cjxl or cwebp) along with its process group."""
+    if _POSIX:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+            return
+        except OSError:
+            # Group already gone - fall through to the plain kill
+            pass
+    proc.kill()
+
+
+def _run_encoder(args: Sequence[str], timeout: Optional[float]) -> Tuple[Optional[int], str]:
+    """
+    Run an encoder command line in its own process group.
+    
+    Args:
+        args: Command and arguments
+        timeout: Seconds to wait before the encoder (and anything it spawned) is killed
+        
+    Returns:
+        Tuple of (return code, stderr). The return code is None if the encoder timed out.
+        
+    Raises:
+        FileNotFoundError: If the encoder executable does not exist
+    """
+    proc = subprocess.Popen(
+        list(args),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        # Own process group, so a timeout can take down anything the encoder spawned
+        start_new_session=_POSIX,
+    )
+    try:
+        _, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_process_tree(proc)
+        _, stderr = proc.communicate()
+        return None, stderr
+    except BaseException:
+        # The encoder is outside the terminal's process group, so Ctrl-C never
+        # reaches it - take it down before letting KeyboardInterrupt (etc.) through
+        _kill_process_tree(proc)
+        proc.wait()
+        raise
+    return proc.returncode, stderr
+
+
+# Raw (on-disk) pixel layouts that hold exactly 8 bits per channel, per mode.
+# Pillow opens e.g. 16-bit RGB PNGs as mode 'RGB' too (raw mode 'RGB;16B'),
+# so the mode alone would let a PNM silently truncate them to 8 bits.
+_EIGHT_BIT_RAWMODES = {
+    'RGB': frozenset({'RGB', 'BGR'}),
+    'L': frozenset({'L'}),
+}
+
+# Info keys for color and metadata that cjxl keeps from the original file
+# but that a PNM can't carry
+_PNM_UNSUPPORTED_INFO = ('icc_profile', 'gamma', 'chromaticity', 'exif', 'xmp', 'transparency')
+
+
+def _is_plain_8bit(img: Image.Image) -> bool:
+    """Check whether an opened image's stored pixels are plain 8-bit RGB/grayscale."""
+    rawmodes = _EIGHT_BIT_RAWMODES.get(img.mode)
+    if not rawmodes or not img.tile:
+        return False
+    for tile in img.tile:
+        args = tile[3]
+        rawmode = args[0] if isinstance(args, tuple) else args
+        if rawmode not in rawmodes:
+            return False
+    return True
+
+
+def _pnm_suffix(img: Image.Image, threshold_mp: float) -> Optional[str]:
+    """PNM suffix ('.ppm' or '.pgm') an opened image streams to cjxl as, or None."""
+    if img.format == 'JPEG' or any(key in img.info for key in _PNM_UNSUPPORTED_INFO):
+        return None
+    if img.width * img.height <= threshold_mp * 1_000_000:
+        return None
+    if not _is_plain_8bit(img):
+        return None
+    if img.mode == 'RGB':
+        return '.ppm'
+    if img.mode == 'L':
+        return '.pgm'
+    return None
+
+
+def _streaming_input_suffix(image_path: Path, threshold_mp: float) -> Optional[str]:
+    """
+    Decide whether an image should be fed to cjxl as a streamed PNM file.
+    
+    Only reads the image header. Streaming is used for images above threshold_mp
+    megapixels whose pixels fit losslessly in PPM/PGM: stored as 8-bit RGB or
+    grayscale, without transparency, ICC profile, gamma/chromaticity or
+    Exif/XMP (a PNM would drop them). JPEG sources keep cjxl's lossless JPEG transcode.
+    
+    Args:
+        image_path: Path to the source image
+        threshold_mp: Minimum size in megapixels for streaming
+        
+    Returns:
+        '.ppm' or '.pgm' if the image should be streamed, None otherwise
+    """
+    try:
+        with Image.open(image_path) as img:
+            return _pnm_suffix(img, threshold_mp)
+    except Exception:
+        return None
+
+
+def pnm_stream_size(image_path: Path, threshold_mp: float) -> int:
+    """
+    Size of the temporary PNM written when an image is streamed to cjxl.
+    
+    Only reads the image header.
+    
+    Args:
+        image_path: Path to the source image
+        threshold_mp: Minimum size in megapixels for streaming
+        
+    Returns:
+        Bytes the PPM/PGM will take (0 if the image won't be streamed)
+    """
+    try:
+        with Image.open(image_path) as img:
+            suffix = _pnm_suffix(img, threshold_mp)
+            if not suffix:
+                return 0
+            channels = 3 if suffix == '.ppm' else 1
+            return img.width * img.height * channels
+    except Exception:
+        return 0
+
+
+def _effort_for_image(image_path: Path, is_jpeg: bool, effort_steps: Sequence[Tuple[float, int]]) -> int:
+    """
+    Pick a JPEG XL effort from the image's size.
+    
+    Args:
+        image_path: Path to the source image
+        is_jpeg: Whether the source is a JPEG (lossless transcode)
+        effort_steps: (min_megapixels, effort) pairs sorted by min_megapixels;
+                      the last step the image reaches wins
+        
+    Returns:
+        Effort to use (0-9)
+    """
+    if is_jpeg:
+        # Lossless JPEG transcode gains next to nothing above effort 7
+        return 7
+    
+    megapixels = _image_megapixels(image_path)
+    effort = effort_steps[0][1]
+    for min_megapixels, step_effort in effort_steps:
+        if megapixels < min_megapixels:
+            break
+        effort = step_effort
+    return effort
+
+
+def convert_to_jpegxl(
+    image_path: Path,
+    output_path: Path,
+    quality: Optional[int] = None,
+    effort: Optional[int] = None,
+    timeout: Optional[int] = None,
+    streaming_threshold_mp: Optional[float] = None,
+    streaming_effort: Optional[int] = None,
+    effort_steps: Optional[Sequence[Tuple[float, int]]] = None,
+    animated: Optional[bool] = None,
+    stream_source: Union[Path, bool, None] = None,
+    config: Optional[Config] = None
+) -> Optional[int]:
     """
     Convert an image to JPEG XL format (lossless, highest compression).
     Uses libjxl's cjxl command-line tool instead of Pillow.
@@ -88,32 +396,46 @@ def convert_to_jpegxl(image_path: Path, output_path: Path, quality: Optional[int
         quality: JPEG XL quality (1-100, 100 = lossless). If None, uses config value.
         effort: JPEG XL effort (0-9, 9 = highest compression). If None, uses config value.
         timeout: Conversion timeout in seconds. If None, uses config value.
+        streaming_threshold_mp: Images above this many megapixels are encoded with
+                                --streaming_input. If None, uses config value.
+        streaming_effort: Maximum effort for streamed images. If None, uses config value.
+        effort_steps: (min_megapixels, effort) pairs for picking the effort by image
+                      size (empty = always use effort). If None, uses config value.
+        animated: Whether the source is an animated GIF, if the caller already knows.
+                  If None, it is detected from the file.
+        stream_source: PNM file the caller already decoded image_path into. It is fed
+                       to cjxl with --streaming_input (and left for the caller to delete).
+                       False encodes image_path directly. If None, large images are
+                       decoded to a PNM here.
+        config: Settings to fill in the values above that are None. If None,
+                config.json is loaded from its default location.
         
     Returns:
         File size in bytes if successful, None if conversion failed
     """
     # Get settings from config if not provided
-    if quality is None or effort is None or timeout is None:
-        try:
-            from config_loader import load_config
-            config = load_config()
-            if quality is None:
-                quality = config.jpegxl_quality
-            if effort is None:
-                effort = config.jpegxl_effort
-            if timeout is None:
-                timeout = config.conversion_timeout
-        except Exception:
-            # Fallback to defaults
-            if quality is None:
-                quality = 100
-            if effort is None:
-                effort = 9
-            if timeout is None:
-                timeout = 300
+    if (quality is None or effort is None or timeout is None
+            or streaming_threshold_mp is None or streaming_effort is None
+            or effort_steps is None):
+        if config is None:
+            config = _default_config()
+        if quality is None:
+            quality = config.jpegxl_quality
+        if effort is None:
+            effort = config.jpegxl_effort
+        if timeout is None:
+            timeout = config.conversion_timeout
+        if streaming_threshold_mp is None:
+            streaming_threshold_mp = config.streaming_threshold_mp
+        if streaming_effort is None:
+            streaming_effort = config.streaming_effort
+        if effort_steps is None:
+            effort_steps = config.adaptive_effort_steps if config.adaptive_effort else ()
     
     # Skip animated GIFs - JPEG XL doesn't support animation
-    if is_animated_gif(image_path):
+    if animated is None:
+        animated = is_animated_gif(image_path)
+    if animated:
         return None
     
     # Check if cjxl is available
@@ -121,31 +443,87 @@ def convert_to_jpegxl(image_path: Path, output_path: Path, quality: Optional[int
     if not cjxl:
         return None
     
+    source_path = image_path
+    stream_path = None
+    extra_args = []
+    is_jpeg = image_path.suffix.lower() in JPEG_EXTENSIONS
+    if quality == 100 and is_jpeg:
+        # Repack the JPEG's DCT coefficients directly instead of decoding to
+        # pixels and re-encoding them (faster, smaller, and bit-exact reversible)
+        extra_args = ['--lossless_jpeg=1']
+    if _cjxl_threads is not None:
+        # Several workers run cjxl at once; each gets its share of the cores
+        extra_args = extra_args + [f'--num_threads={_cjxl_threads}']
+    
+    if effort_steps:
+        # jpegxl_effort stays the upper bound; big images step down to cheaper efforts
+        effort = min(effort, _effort_for_image(image_path, is_jpeg, effort_steps))
+        logging.getLogger('image-squisher').info(f"Using JXL effort {effort} for {image_path.name}")
+    
     try:
+        # Large images: hand cjxl a PNM it can stream from instead of a PNG it
+        # must decode into memory in full (peak RSS otherwise grows with image area)
+        if stream_source is None:
+            stream_suffix = _streaming_input_suffix(image_path, streaming_threshold_mp)
+            if stream_suffix:
+                stream_path = output_path.with_name(output_path.name + stream_suffix)
+                try:
+                    with Image.open(image_path) as img:
+                        img.save(stream_path, format='PPM')
+                    stream_source = stream_path
+                except Exception as e:
+                    # e.g. no room for the PNM - let cjxl read the original at full effort
+                    logging.getLogger('image-squisher').warning(
+                        f"Could not write PNM for {image_path.name}, encoding it directly: {e}"
+                    )
+        if stream_source:
+            source_path = stream_source
+            effort = min(effort, streaming_effort)
+            extra_args = extra_args + ['--streaming_input']
+            logging.getLogger('image-squisher').debug(
+                f"Streaming {image_path.name} to cjxl at effort {effort}"
+            )
+        
         # Use cjxl command-line tool for conversion
         # -q 100 = mathematically lossless (quality 100)
         # -e 7 = effort 7 (good compression, much faster than 9 with minimal size difference)
         # Note: cjxl doesn't have --lossless flag, use -q 100 instead
-        result = subprocess.run(
-            [
-                cjxl,
-                str(image_path),
-                str(output_path),
-                '-q', str(quality),
-                '-e', str(effort),
-            ],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
+        try:
+            returncode, stderr = _run_encoder(
+                [
+                    cjxl,
+                    str(source_path),
+                    str(output_path),
+                    '-q', str(quality),
+                    '-e', str(effort),
+                    *extra_args,
+                ],
+                timeout,
+            )
+        except FileNotFoundError:
+            # cjxl disappeared since it was looked up - re-probe on the next call
+            # instead of failing every remaining image the same way
+            _check_cjxl_available.cache_clear()
+            logging.getLogger('image-squisher').warning(
+                f"cjxl not found at {cjxl}, skipping JPEG XL for {image_path.name}"
+            )
+            return None
+        if returncode is None:
+            # The stuck encoder was killed right away instead of being left to the hang detector
+            logging.getLogger('image-squisher').warning(
+                f"cjxl timed out after {timeout}s on {image_path.name}, killed it"
+            )
+            if output_path.exists():
+                output_path.unlink()
+            return None
         
-        if result.returncode == 0 and output_path.exists():
+        if returncode == 0 and output_path.exists():
             return output_path.stat().st_size
         else:
             # Conversion failed - log error for debugging
-            if result.stderr:
+            if stderr:
                 # Only log if there's actual error output (ignore warnings)
-                error_msg = result.stderr.strip()
+                error_msg = stderr.strip()
                 if error_msg and not error_msg.startswith('Warn'):
                     # Silently fail - errors are expected for some images
                     pass
@@ -153,84 +531,211 @@ def convert_to_jpegxl(image_path: Path, output_path: Path, quality: Optional[int
             if output_path.exists():
                 output_path.unlink()
             return None
-    except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
+    except Exception:
         # Conversion failed
         if output_path.exists():
             output_path.unlink()
         return None
+    finally:
+        if stream_path is not None and stream_path.exists():
+            stream_path.unlink()
+
+
+def _skip_gif_sub_blocks(f: BinaryIO) -> None:
+    """Skip a chain of GIF data sub-blocks, up to and including the empty terminator."""
+    while True:
+        size = f.read(1)
+        if not size or size[0] == 0:
+            return
+        f.seek(size[0], os.SEEK_CUR)
 
 
-def convert_to_webp(image_path: Path, output_path: Path, method: Optional[int] = None, max_frames: Optional[int] = None) -> Optional[int]:
+def _gif_frame_durations(image_path: Path, frame_count: int) -> List[int]:
+    """
+    Read per-frame durations from a GIF's graphic control extensions.
+    
+    Only the block headers are walked; the LZW image data is skipped without
+    being decompressed (Pillow's seek() decodes each frame it moves past).
+    
+    Args:
+        image_path: Path to the GIF file
+        frame_count: Number of frames to read durations for
+        
+    Returns:
+        Durations in milliseconds, one per frame (100 for frames without one)
+    """
+    durations = []
+    with open(image_path, 'rb') as f:
+        header = f.read(13)
+        if len(header) == 13 and header[10] & 0x80:
+            # Global color table
+            f.seek(3 << ((header[10] & 7) + 1), os.SEEK_CUR)
+        
+        duration = None
+        while len(durations) < frame_count:
+            introducer = f.read(1)
+            if introducer == b'!':
+                label = f.read(1)
+                size = f.read(1)
+                if not size:
+                    break
+                block = f.read(size[0])
+                if label == b'\xf9' and len(block) >= 3:
+                    duration = int.from_bytes(block[1:3], 'little') * 10
+                if size[0]:
+                    _skip_gif_sub_blocks(f)
+            elif introducer == b',':
+                descriptor = f.read(9)
+                if len(descriptor) < 9:
+                    break
+                if descriptor[8] & 0x80:
+                    # Local color table
+                    f.seek(3 << ((descriptor[8] & 7) + 1), os.SEEK_CUR)
+                f.read(1)  # LZW minimum code size
+                _skip_gif_sub_blocks(f)
+                durations.append(100 if duration is None else duration)
+                duration = None
+            else:
+                # Trailer, end of file or a malformed block
+                break
+    
+    durations.extend([100] * (frame_count - len(durations)))
+    return durations
+
+
+def convert_to_webp(
+    image_path: Path,
+    output_path: Path,
+    method: Optional[int] = None,
+    max_frames: Optional[int] = None,
+    animated: Optional[bool] = None,
+    decoded: Optional[Image.Image] = None,
+    timeout: Optional[int] = None,
+    config: Optional[Config] = None,
+    stream_source: Optional[Path] = None
+) -> Optional[int]:
     """
     Convert an image to WebP format (lossless, highest compression).
     Supports both static images and animated GIFs (converts to animated WebP).
+    Static PNG/JPEG/TIFF files (or the PNM in stream_source) are encoded with
+    libwebp's cwebp when it is installed, otherwise (or if cwebp fails) with Pillow.
     
     Args:
         image_path: Path to the source image
         output_path: Path where the WebP file should be saved
         method: WebP compression method (0-6, 6 = highest). If None, uses config value.
         max_frames: Maximum frames for animated GIFs. If None, uses config value.
+        animated: Whether the source is an animated GIF, if the caller already knows.
+                  If None, it is read from the opened image.
+        decoded: Static image the caller already decoded from image_path; encoded
+                 instead of opening the file again (and not closed here).
+        timeout: cwebp timeout in seconds. If None, uses config value.
+        config: Settings to fill in the values above that are None. If None,
+                config.json is loaded from its default location.
+        stream_source: PNM file the caller already decoded image_path into; read by
+                       cwebp instead of the original (and left for the caller to delete).
         
     Returns:
         File size in bytes if successful, None if conversion failed
     """
     # Get settings from config if not provided
-    if method is None or max_frames is None:
-        try:
-            from config_loader import load_config
-            config = load_config()
-            if method is None:
-                method = config.webp_method
-            if max_frames is None:
-                max_frames = config.max_animated_frames
-        except Exception:
-            # Fallback to defaults
-            if method is None:
-                method = 6
-            if max_frames is None:
-                max_frames = 1000
+    if method is None or max_frames is None or timeout is None:
+        if config is None:
+            config = _default_config()
+        if method is None:
+            method = config.webp_method
+        if max_frames is None:
+            max_frames = config.max_animated_frames
+        if timeout is None:
+            timeout = config.conversion_timeout
+    
+    # cwebp is multi-threaded and much faster than Pillow at method 6. Files it
+    # can't read (it exits with an error) fall through to Pillow below.
+    cwebp_input = stream_source if stream_source is not None else image_path
+    if cwebp_input.suffix.lower() in CWEBP_INPUT_EXTENSIONS:
+        cwebp = _check_cwebp_available()
+        if cwebp:
+            try:
+                returncode, _ = _run_encoder(
+                    [
+                        cwebp,
+                        '-quiet',
+                        '-lossless',
+                        '-m', str(method),
+                        '-mt',
+                        str(cwebp_input),
+                        '-o', str(output_path),
+                    ],
+                    timeout,
+                )
+            except FileNotFoundError:
+                # cwebp disappeared since it was looked up - re-probe on the next call
+                _check_cwebp_available.cache_clear()
+            else:
+                if returncode == 0 and output_path.exists():
+                    return output_path.stat().st_size
+                if output_path.exists():
+                    output_path.unlink()
+                if returncode is None:
+                    logging.getLogger('image-squisher').warning(
+                        f"cwebp timed out after {timeout}s on {image_path.name}, killed it"
+                    )
+                    return None
     
     try:
-        with Image.open(image_path) as img:
-            # Check if it's an animated GIF
-            if is_animated_gif(image_path):
+        source = contextlib.nullcontext(decoded) if decoded is not None else Image.open(image_path)
+        with source as img:
+            # Check if it's an animated GIF (reusing this handle instead of reopening the file)
+            if animated is None:
+                animated = image_path.suffix.lower() == '.gif' and getattr(img, 'is_animated', False)
+            if animated:
                 # Convert animated GIF to animated WebP
-                frames = []
-                durations = []
-                
                 try:
-                    # Extract all frames
-                    frame_count = 0
+                    total_frames = img.n_frames
+                    frame_count = min(total_frames, max_frames)
+                    loop = img.info.get('loop', 0)  # Preserve loop count if available
                     
-                    while True:
-                        # Convert frame to RGBA if needed
-                        frame = img.copy()
-                        if frame.mode in ('P', 'LA', 'PA'):
-                            frame = frame.convert('RGBA')
-                        elif frame.mode == 'L':
-                            # Keep grayscale as-is
-                            pass
-                        elif frame.mode not in ('RGB', 'RGBA'):
-                            frame = frame.convert('RGB')
-                        
-                        frames.append(frame)
-                        
-                        # Get frame duration (default to 100ms if not available)
-                        duration = img.info.get('duration', 100)
-                        durations.append(duration)
-                        
-                        frame_count += 1
-                        if frame_count >= max_frames:
-                            break
-                        
-                        # Try to seek to next frame
-                        try:
-                            img.seek(img.tell() + 1)
-                        except EOFError:
-                            break
+                    if frame_count == total_frames:
+                        # Save the GIF itself: Pillow's animated WebP encoder seeks
+                        # through a multi-frame source one frame at a time, so only
+                        # the current frame is ever decoded in memory.
+                        # (append_images would be materialized into a list first.)
+                        # Durations are read from the GIF's block headers, since
+                        # seeking a GIF in Pillow decodes every frame it passes.
+                        # The GIF's background index is passed as the gray level
+                        # it became when the frames were converted to RGBA first
+                        # (Pillow would otherwise look it up in the palette).
+                        background = img.info.get('background', (0, 0, 0, 0))
+                        if isinstance(background, int):
+                            background = (background, background, background, 255)
+                        img.save(
+                            output_path,
+                            format='WEBP',
+                            save_all=True,
+                            duration=_gif_frame_durations(image_path, frame_count),
+                            lossless=True,
+                            method=method,
+                            loop=loop,
+                            background=background,
+                        )
+                        return output_path.stat().st_size
                     
-                    if not frames:
-                        return None
+                    # Truncated to max_frames: the encoder can't be told to stop
+                    # early, so hand it an explicit list of the frames to keep
+                    frames = []
+                    durations = []
+                    for index in range(frame_count):
+                        img.seek(index)
+                        durations.append(img.info.get('duration', 100))
+                        # convert() already returns a copy, so only copy when unconverted
+                        if img.mode in ('P', 'LA', 'PA'):
+                            frame = img.convert('RGBA')
+                        elif img.mode in ('L', 'RGB', 'RGBA'):
+                            # Keep grayscale/RGB as-is
+                            frame = img.copy()
+                        else:
+                            frame = img.convert('RGB')
+                        frames.append(frame)
                     
                     # Save as animated WebP
                     frames[0].save(
@@ -241,7 +746,7 @@ def convert_to_webp(image_path: Path, output_path: Path, method: Optional[int] =
                         duration=durations,
                         lossless=True,
                         method=method,
-                        loop=img.info.get('loop', 0),  # Preserve loop count if available
+                        loop=loop,
                     )
                     
                     return output_path.stat().st_size
@@ -278,7 +783,51 @@ def convert_to_webp(image_path: Path, output_path: Path, method: Optional[int] =
         return None
 
 
-def convert_image(image_path: Path, temp_dir: Path, original_size: Optional[int] = None) -> Tuple[Optional[Path], Optional[Path], Optional[int], Optional[int]]:
+def _decode_to_pnm(image_path: Path, pnm_path: Path) -> Optional[Image.Image]:
+    """
+    Decode an image once and write it to a PNM file for cjxl --streaming_input.
+    
+    Args:
+        image_path: Path to the source image (8-bit RGB or grayscale)
+        pnm_path: Path where the PPM/PGM file should be written
+        
+    Returns:
+        The decoded image (caller closes it), or None if decoding or writing failed
+    """
+    try:
+        img = Image.open(image_path)
+        try:
+            img.load()
+            img.save(pnm_path, format='PPM')
+        except Exception:
+            img.close()
+            raise
+        return img
+    except Exception as e:
+        logging.getLogger('image-squisher').debug(f"Shared decode failed for {image_path.name}: {e}")
+        if pnm_path.exists():
+            pnm_path.unlink()
+        return None
+
+
+def _future_outcome(future: Future) -> Tuple[Optional[int], Optional[str]]:
+    """Split a finished conversion future into (size, error message)."""
+    error = future.exception()
+    if error is not None:
+        return None, str(error)
+    return future.result(), None
+
+
+def convert_image(
+    image_path: Path,
+    temp_dir: Path,
+    original_size: Optional[int] = None,
+    timeout: Optional[int] = None,
+    also_try_webp_for_jpeg: Optional[bool] = None,
+    early_exit_ratio: Optional[float] = None,
+    streaming_threshold_mp: Optional[float] = None,
+    config: Optional[Config] = None
+) -> Tuple[Optional[Path], Optional[Path], Optional[int], Optional[int]]:
     """
     Convert an image to both JPEG XL and WebP formats in parallel.
     
@@ -286,6 +835,17 @@ def convert_image(image_path: Path, temp_dir: Path, original_size: Optional[int]
         image_path: Path to the source image
         temp_dir: Directory where temporary converted files should be saved
         original_size: Original file size in bytes (for early exit optimization)
+        timeout: Timeout in seconds for each encoder subprocess (cjxl, cwebp).
+                 If None, uses config value.
+        also_try_webp_for_jpeg: If False, JPEG sources are only transcoded to JPEG XL
+                                (when cjxl is available). If None, uses config value.
+        early_exit_ratio: If above 0, encode JPEG XL first and skip WebP when the JPEG XL
+                          file is smaller than this fraction of original_size.
+                          If None, uses config value.
+        streaming_threshold_mp: Images above this many megapixels are decoded once and
+                                shared by both encoders. If None, uses config value.
+        config: Settings for the values above that are None and for both encoders.
+                If None, config.json is loaded from its default location.
         
     Returns:
         Tuple of (jxl_path, webp_path, jxl_size, webp_size)
@@ -293,70 +853,144 @@ def convert_image(image_path: Path, temp_dir: Path, original_size: Optional[int]
     """
     logger = logging.getLogger('image-squisher')
     
-    base_name = image_path.stem
+    # Resolved once here and handed to both encoders
+    if config is None:
+        config = _default_config()
+    if also_try_webp_for_jpeg is None:
+        also_try_webp_for_jpeg = config.also_try_webp_for_jpeg
+    if early_exit_ratio is None:
+        early_exit_ratio = config.early_exit_ratio
+    if streaming_threshold_mp is None:
+        streaming_threshold_mp = config.streaming_threshold_mp
+    
+    # Lossless WebP of a decoded JPEG is almost never smaller than the JPEG itself,
+    # while cjxl's JPEG transcode nearly always is - skip the WebP decode/encode
+    try_webp = (
+        also_try_webp_for_jpeg
+        or image_path.suffix.lower() not in JPEG_EXTENSIONS
+        or not _check_cjxl_available()
+    )
+    
+    # Parse the GIF header once for both encoders (only .gif files are opened)
+    animated = is_animated_gif(image_path)
+    
+    # Use the full file name so sources that share a stem (photo.png / photo.bmp)
+    # never write to the same temp file when processed concurrently. A shared
+    # temp directory also sees same-named files from different folders, so
+    # prefix the worker's PID (each worker converts one image at a time).
+    base_name = image_path.name
+    if temp_dir != image_path.parent:
+        base_name = f"{os.getpid()}-{base_name}"
     
     jxl_path = temp_dir / f"{base_name}.tmp.jxl"
     webp_path = temp_dir / f"{base_name}.tmp.webp"
     
-    # Convert both formats in parallel using threads
-    jxl_result = [None]  # Use list to allow modification from nested function
-    webp_result = [None]
-    jxl_error = [None]
-    webp_error = [None]
+    # Large images would be decoded twice (PNM for cjxl, pixels for WebP):
+    # decode once, give cjxl (and cwebp, if installed) the PNM and Pillow's
+    # WebP encoder the already-decoded image
+    stream_path = None
+    # None leaves the streaming decision to convert_to_jpegxl; False means it
+    # was already made here (don't open the image again to re-check)
+    jxl_stream_source = None
+    if try_webp and not animated and _check_cjxl_available():
+        stream_suffix = _streaming_input_suffix(image_path, streaming_threshold_mp)
+        if stream_suffix:
+            stream_path = temp_dir / f"{base_name}.tmp{stream_suffix}"
+        jxl_stream_source = stream_path or False
+    shared_image = None
     
-    def convert_jxl():
-        try:
-            jxl_result[0] = convert_to_jpegxl(image_path, jxl_path)
-            if jxl_result[0] is None:
-                logger.info(f"JXL conversion failed for {image_path.name}")
-            else:
-                logger.info(f"JXL conversion succeeded for {image_path.name}: {jxl_result[0]} bytes")
-        except Exception as e:
-            jxl_error[0] = str(e)
-            logger.warning(f"JXL conversion exception for {image_path.name}: {e}", exc_info=True)
+    def convert_jxl() -> Optional[int]:
+        size = convert_to_jpegxl(
+            image_path, jxl_path, timeout=timeout, animated=animated,
+            stream_source=jxl_stream_source, config=config,
+        )
+        if size is None:
+            logger.info(f"JXL conversion failed for {image_path.name}")
+        else:
+            logger.info(f"JXL conversion succeeded for {image_path.name}: {size} bytes")
+        return size
     
-    def convert_webp():
-        try:
-            webp_result[0] = convert_to_webp(image_path, webp_path)
-            if webp_result[0] is None:
-                logger.info(f"WebP conversion failed for {image_path.name}")
-            else:
-                logger.info(f"WebP conversion succeeded for {image_path.name}: {webp_result[0]} bytes")
-        except Exception as e:
-            webp_error[0] = str(e)
-            logger.warning(f"WebP conversion exception for {image_path.name}: {e}", exc_info=True)
-    
-    # Start both conversions in parallel
-    jxl_thread = threading.Thread(target=convert_jxl)
-    webp_thread = threading.Thread(target=convert_webp)
-    
-    logger.info(f"Starting both JXL and WebP conversions in parallel for {image_path.name}")
-    jxl_thread.start()
-    webp_thread.start()
-    
-    # Wait for JXL to complete first (it's usually faster)
-    jxl_thread.join()
-    jxl_size = jxl_result[0]
-    
-    # Early exit optimization: if JXL is already significantly smaller than original,
-    # we can skip waiting for WebP (but still let it finish in background)
-    skip_webp_wait = False
-    if original_size and jxl_size and jxl_size < original_size * 0.7:  # JXL is 30%+ smaller
-        # JXL is already very good, but still wait for WebP to compare
-        # (WebP might be even smaller)
-        pass
-    
-    # Wait for WebP to complete
-    webp_thread.join()
-    webp_size = webp_result[0]
+    def convert_webp() -> Optional[int]:
+        size = convert_to_webp(
+            image_path, webp_path, animated=animated, decoded=shared_image,
+            timeout=timeout, config=config, stream_source=stream_path,
+        )
+        if size is None:
+            logger.info(f"WebP conversion failed for {image_path.name}")
+        else:
+            logger.info(f"WebP conversion succeeded for {image_path.name}: {size} bytes")
+        return size
+    
+    # A running WebP encode can't be cancelled, so early exit means waiting
+    # for JXL before deciding whether to start WebP at all
+    jxl_first = try_webp and early_exit_ratio > 0 and original_size and _check_cjxl_available()
+    skipped_early = False
+    
+    # Run both encoders concurrently: cjxl is a subprocess and Pillow's WebP
+    # encoder releases the GIL, so the two overlap on separate cores
+    if jxl_first:
+        logger.info(f"Starting JXL conversion before WebP for {image_path.name}")
+    else:
+        logger.info(f"Starting both JXL and WebP conversions in parallel for {image_path.name}")
+    if _megapixel_budget is not None:
+        reservation = _megapixel_budget.reserve(_image_megapixels(image_path))
+    else:
+        reservation = contextlib.nullcontext()
+    try:
+        with reservation, ThreadPoolExecutor(max_workers=2) as executor:
+            if stream_path is not None:
+                shared_image = _decode_to_pnm(image_path, stream_path)
+                if shared_image is None:
+                    # Let each encoder read the file on its own
+                    stream_path = None
+                    jxl_stream_source = False
+                elif _check_cwebp_available():
+                    # cwebp encodes from the PNM; don't hold the pixels for it too
+                    # (if cwebp fails, Pillow falls back to reading the original)
+                    shared_image.close()
+                    shared_image = None
+            jxl_future = executor.submit(convert_jxl)
+            if jxl_first:
+                first_size, _ = _future_outcome(jxl_future)
+                skipped_early = first_size is not None and first_size < original_size * early_exit_ratio
+                try_webp = not skipped_early
+            webp_future = executor.submit(convert_webp) if try_webp else None
+    finally:
+        if shared_image is not None:
+            shared_image.close()
+        if stream_path is not None and stream_path.exists():
+            stream_path.unlink()
+    
+    jxl_size, jxl_error = _future_outcome(jxl_future)
+    if jxl_error:
+        logger.warning(f"JXL conversion exception for {image_path.name}: {jxl_error}", exc_info=jxl_future.exception())
+    if skipped_early:
+        logger.info(
+            f"Skipped WebP conversion for {image_path.name}: JXL is already "
+            f"below {early_exit_ratio:.0%} of the original"
+        )
+        webp_size, webp_error = None, None
+    elif webp_future is None:
+        logger.info(f"Skipped WebP conversion for JPEG source {image_path.name}")
+        webp_size, webp_error = None, None
+    else:
+        webp_size, webp_error = _future_outcome(webp_future)
+        if webp_error:
+            logger.warning(f"WebP conversion exception for {image_path.name}: {webp_error}", exc_info=webp_future.exception())
     
     # Log results for debugging
-    if jxl_size is None and webp_size is None:
+    if not try_webp:
+        # Also taken when WebP was skipped early, which implies JXL succeeded
+        if jxl_size is None:
+            logger.warning(f"JXL transcode failed for JPEG source {image_path.name}")
+            if jxl_error:
+                logger.warning(f"JXL error: {jxl_error}")
+    elif jxl_size is None and webp_size is None:
         logger.warning(f"Both JXL and WebP conversions failed for {image_path.name}")
-        if jxl_error[0]:
-            logger.warning(f"JXL error: {jxl_error[0]}")
-        if webp_error[0]:
-            logger.warning(f"WebP error: {webp_error[0]}")
+        if jxl_error:
+            logger.warning(f"JXL error: {jxl_error}")
+        if webp_error:
+            logger.warning(f"WebP error: {webp_error}")
     elif jxl_size is None:
         logger.info(f"JXL conversion failed, WebP succeeded ({webp_size} bytes) for {image_path.name}")
     elif webp_size is None:
@@ -364,13 +998,15 @@ def convert_image(image_path: Path, temp_dir: Path, original_size: Optional[int]
     else:
         logger.info(f"Both conversions succeeded for {image_path.name}: JXL={jxl_size} bytes, WebP={webp_size} bytes")
     
-    # Clean up if conversion failed
-    if jxl_size is None and jxl_path.exists():
-        jxl_path.unlink()
+    # Clean up if conversion failed (or was skipped)
+    if jxl_size is None:
+        if jxl_path.exists():
+            jxl_path.unlink()
         jxl_path = None
     
-    if webp_size is None and webp_path.exists():
-        webp_path.unlink()
+    if webp_size is None:
+        if webp_path.exists():
+            webp_path.unlink()
         webp_path = None
     
     return jxl_path, webp_path, jxl_size, webp_size